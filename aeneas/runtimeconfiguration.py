@@ -262,6 +262,24 @@ class RuntimeConfiguration(Configuration):
 
     """
 
+    ELEVEN_LABS_BATCH_SIZE = "eleven_labs_batch_size"
+    """
+    Synthesize up to this number of short text fragments
+    with a single call to the Eleven Labs TTS API,
+    separating them with breaks which are then detected
+    in the synthesized audio to split it back into fragments.
+    If the breaks cannot be detected unambiguously,
+    the fragments are synthesized one at a time.
+
+    Note that the silence at the beginning and at the end
+    of a fragment synthesized in a batch might differ
+    from the one of the same fragment synthesized alone,
+    hence fragments synthesized in a batch
+    are not stored in the persistent cache (``tts_cache_dir``).
+
+    Default: ``1``, meaning that batching is disabled.
+    """
+
     ELEVEN_LABS_SIMILARITY_BOOST = "eleven_labs_similarity_boost"
     """
     Adjust the similarity boost for the Eleven Labs TTS API.
@@ -786,6 +804,48 @@ class RuntimeConfiguration(Configuration):
     .. versionadded:: 1.6.0
     """
 
+    TTS_CACHE_DIR = "tts_cache_dir"
+    """
+    If set to the path of a directory and
+    :data:`~aeneas.runtimeconfiguration.RuntimeConfiguration.TTS_CACHE`
+    is ``True``, TTS API wrappers supporting it
+    will also store the synthesized audio files in that directory,
+    and reuse them across runs instead of calling the TTS API again.
+
+    Unlike the in-memory TTS cache,
+    the files in this directory are not removed
+    after the synthesis is completed.
+
+    Default: ``None``.
+    """
+
+    TTS_CACHE_TTL = "tts_cache_ttl"
+    """
+    Discard the files stored in
+    :data:`~aeneas.runtimeconfiguration.RuntimeConfiguration.TTS_CACHE_DIR`
+    older than this number of seconds.
+
+    Default: ``0``, meaning that files never expire.
+    """
+
+    TTS_API_PARALLELISM = "tts_api_parallelism"
+    """
+    Synthesize up to this number of text fragments concurrently.
+    This parameter is mostly useful with TTS API wrappers,
+    whose calls spend most of their time waiting for the network.
+    It must be an integer greater than zero.
+
+    Note that API calls are still throttled by ``tts_api_sleep``:
+    up to this number of calls can start at once,
+    and then up to this number of calls
+    every ``tts_api_sleep`` seconds,
+    that is, each concurrent fragment waits ``tts_api_sleep``
+    seconds between its calls, as it would if run alone.
+
+    Default: ``1``, meaning that fragments are synthesized
+    one at a time.
+    """
+
     TTS_API_SLEEP = "tts_api_sleep"
     """
     Wait this number of seconds before the next HTTP POST request
@@ -793,6 +853,13 @@ class RuntimeConfiguration(Configuration):
     This parameter can be used to throttle the HTTP usage.
     It cannot be a negative value.
 
+    The Eleven Labs TTS API wrapper shares it
+    among the ``tts_api_parallelism`` concurrent fragments:
+    up to ``tts_api_parallelism`` requests can start at once,
+    and then up to ``tts_api_parallelism`` requests
+    every ``tts_api_sleep`` seconds.
+    Set it to ``0.000`` to disable throttling.
+
     Note that this parameter was called ``nuance_tts_api_sleep``
     before v1.7.0.
 
@@ -807,6 +874,11 @@ class RuntimeConfiguration(Configuration):
     for this number of times before giving up.
     It must be an integer greater than zero.
 
+    This is the total number of HTTP POST requests,
+    including the first one.
+    The Eleven Labs TTS API wrapper retries a request
+    only if the API returns a transient error status code.
+
     Note that this parameter was called ``nuance_tts_api_retry_attempts``
     before v1.7.0.
 
@@ -968,6 +1040,7 @@ class RuntimeConfiguration(Configuration):
 
         (ELEVEN_LABS_API_KEY, (None, None, [], u"Eleven Labs Developer API Key")),
         (ELEVEN_LABS_VOICE_ID, (None, None, [], u"Eleven Labs Voice ID")),
+        (ELEVEN_LABS_BATCH_SIZE, (1, int, [], u"max number of fragments per Eleven Labs API call")),
         (ELEVEN_LABS_SIMILARITY_BOOST, (0.75, float, [], u"Eleven Labs similarity boost")),
         (ELEVEN_LABS_STABILITY, (0.75, float, [], u"Eleven Labs stability")),
 
@@ -1021,6 +1094,9 @@ class RuntimeConfiguration(Configuration):
         (TTS_PATH, (None, None, [], u"path of the TTS executable/wrapper")),                # None (= default) or "espeak" or "/usr/bin/espeak"
         (TTS_VOICE_CODE, (None, None, [], u"overrides TTS voice code selected by language with this value")),
         (TTS_CACHE, (False, bool, [], u"if True, cache synthesized audio files")),
+        (TTS_CACHE_DIR, (None, None, [], u"path to the persistent TTS cache dir")),
+        (TTS_CACHE_TTL, (0, int, [], u"lifetime of persistent TTS cache files, in s (0 to disable)")),
+        (TTS_API_PARALLELISM, (1, int, [], u"number of text fragments synthesized concurrently")),
         (TTS_API_SLEEP, ("1.000", TimeValue, [], u"sleep between TTS API calls, in s")),
         (TTS_API_RETRY_ATTEMPTS, (5, int, [], u"number of retries for a failed TTS API call")),
 
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# aeneas is a Python/C library and a set of tools
+# to automagically synchronize audio and text (aka forced alignment)
+#
+# Copyright (C) 2012-2013, Alberto Pettarin (www.albertopettarin.it)
+# Copyright (C) 2013-2015, ReadBeyond Srl   (www.readbeyond.it)
+# Copyright (C) 2015-2017, Alberto Pettarin (www.albertopettarin.it)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+import sys
+import threading
+import time
+import unittest
+
+from aeneas.exacttiming import TimeValue
+from aeneas.language import Language
+from aeneas.runtimeconfiguration import RuntimeConfiguration
+from aeneas.textfile import TextFile
+from aeneas.textfile import TextFragment
+from aeneas.ttswrappers.basettswrapper import BaseTTSWrapper
+from aeneas.ttswrappers.basettswrapper import TTSRateLimiter
+from aeneas.wavfile import read as scipywavread
+from aeneas.wavfile import write as scipywavwrite
+import aeneas.globalfunctions as gf
+
+try:
+    import concurrent.futures
+    HAS_FUTURES = True
+except ImportError:
+    HAS_FUTURES = False
+
+
+class DummyTTSWrapper(BaseTTSWrapper):
+    """
+    A TTS wrapper which synthesizes each character
+    as 10 ms of a constant sample, without calling any TTS engine,
+    and which records the texts it was asked to synthesize.
+    """
+
+    LANGUAGE_TO_VOICE_CODE = {Language.ENG: u"eng"}
+
+    DEFAULT_LANGUAGE = Language.ENG
+
+    OUTPUT_AUDIO_FORMAT = ("pcm_s16le", 1, 16000)
+
+    HAS_PYTHON_CALL = True
+
+    DELAY = 0.05
+
+    TAG = u"DummyTTSWrapper"
+
+    def __init__(self, rconf=None, logger=None):
+        super(DummyTTSWrapper, self).__init__(rconf=rconf, logger=logger)
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.delays = {}
+        self.lock = threading.Lock()
+
+    def _synthesize_single_python_helper(self, text, voice_code, output_file_path=None, return_audio_data=True, text_file=None):
+        with self.lock:
+            self.calls.append(text)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        # NOTE let concurrent calls overlap
+        time.sleep(self.delays.get(text, self.DELAY))
+        with self.lock:
+            self.active -= 1
+        pcm = numpy.ones(160 * len(text), dtype=numpy.int16) * (ord(text[0]) if len(text) > 0 else 0)
+        if output_file_path is not None:
+            scipywavwrite(output_file_path, 16000, pcm)
+        samples = pcm.astype("float64") / 32768
+        return (True, (TimeValue(len(text)) / TimeValue(100), 16000, "pcm16", samples))
+
+
+class DummyStdoutTTSWrapper(BaseTTSWrapper):
+    """
+    A TTS wrapper which calls a Python subprocess
+    reading the text from stdin and writing
+    a PCM16 mono WAVE file with 10 ms of audio per character
+    to stdout, and which records the audio files it reads.
+    """
+
+    LANGUAGE_TO_VOICE_CODE = {Language.ENG: u"eng"}
+
+    DEFAULT_LANGUAGE = Language.ENG
+
+    OUTPUT_AUDIO_FORMAT = ("pcm_s16le", 1, 16000)
+
+    HAS_SUBPROCESS_CALL = True
+
+    SCRIPT = u"; ".join([
+        u"import io, struct, sys, wave",
+        u"text = sys.stdin.read().strip()",
+        u"buf = io.BytesIO()",
+        u"f = wave.open(buf, 'wb')",
+        u"f.setnchannels(1)",
+        u"f.setsampwidth(2)",
+        u"f.setframerate(16000)",
+        u"f.writeframes(struct.pack('<h', 1000) * (160 * len(text)))",
+        u"f.close()",
+        u"getattr(sys.stdout, 'buffer', sys.stdout).write(buf.getvalue())",
+    ])
+
+    TAG = u"DummyStdoutTTSWrapper"
+
+    def __init__(self, rconf=None, logger=None):
+        super(DummyStdoutTTSWrapper, self).__init__(rconf=rconf, logger=logger)
+        self.files_read = []
+        self.set_subprocess_arguments([
+            sys.executable,
+            u"-c",
+            self.SCRIPT,
+            self.CLI_PARAMETER_TEXT_STDIN,
+            self.CLI_PARAMETER_WAVE_STDOUT
+        ])
+
+    def _read_audio_data(self, file_path):
+        self.files_read.append(file_path)
+        return super(DummyStdoutTTSWrapper, self)._read_audio_data(file_path)
+
+
+class TestBaseTTSWrapperPythonCall(unittest.TestCase):
+
+    def tfl(self, texts):
+        tfl = TextFile()
+        for i, text in enumerate(texts):
+            tfl.add_fragment(TextFragment(u"f%03d" % i, Language.ENG, [text], [text]))
+        return tfl
+
+    def wrapper(self, parallelism=1, cache=False):
+        rconf = RuntimeConfiguration()
+        rconf[RuntimeConfiguration.TTS_API_PARALLELISM] = parallelism
+        rconf[RuntimeConfiguration.TTS_CACHE] = cache
+        return DummyTTSWrapper(rconf=rconf)
+
+    def synthesize(self, tts_engine, tfl, quit_after=None, backwards=False, read_samples=False):
+        handler, output_file_path = gf.tmp_file(suffix=".wav")
+        try:
+            result = tts_engine.synthesize_multiple(tfl, output_file_path, quit_after, backwards)
+            if read_samples:
+                sample_rate, samples = scipywavread(output_file_path)
+                return (result, samples)
+            return result
+        finally:
+            gf.delete_file(handler, output_file_path)
+            tts_engine.clear_cache()
+
+    def runs(self, samples):
+        # return the list of (value, length) of the runs of equal samples
+        runs = []
+        for sample in samples:
+            if (len(runs) > 0) and (runs[-1][0] == sample):
+                runs[-1][1] += 1
+            else:
+                runs.append([sample, 1])
+        return [tuple(run) for run in runs]
+
+    def test_loop_fragments_order(self):
+        texts = [u"a" * (i + 1) for i in range(10)]
+        for parallelism in [1, 4]:
+            tts_engine = self.wrapper(parallelism=parallelism)
+            anchors, total_time, num_chars = self.synthesize(tts_engine, self.tfl(texts))
+            self.assertEqual([a[1] for a in anchors], [u"f%03d" % i for i in range(10)])
+            self.assertEqual([a[0] for a in anchors], [TimeValue(sum(range(i + 1))) / TimeValue(100) for i in range(10)])
+            self.assertEqual(total_time, TimeValue("0.550"))
+            self.assertEqual(num_chars, 55)
+            self.assertEqual(sorted(tts_engine.calls), sorted(texts))
+
+    def test_loop_fragments_concurrent(self):
+        tts_engine = self.wrapper(parallelism=1)
+        self.synthesize(tts_engine, self.tfl([u"a", u"b", u"c", u"d"]))
+        self.assertEqual(tts_engine.max_active, 1)
+        tts_engine = self.wrapper(parallelism=4)
+        self.synthesize(tts_engine, self.tfl([u"a", u"b", u"c", u"d"]))
+        if HAS_FUTURES:
+            self.assertGreater(tts_engine.max_active, 1)
+            self.assertLessEqual(tts_engine.max_active, 4)
+        else:
+            # without concurrent.futures fragments are synthesized one at a time
+            self.assertEqual(tts_engine.max_active, 1)
+
+    def test_loop_fragments_slow_request(self):
+        if not HAS_FUTURES:
+            return
+        tts_engine = self.wrapper(parallelism=2)
+        tts_engine.delays[u"slow"] = 0.6
+        texts = [u"slow"] + [u"fast%d" % i for i in range(8)]
+        start = time.time()
+        anchors, total_time, num_chars = self.synthesize(tts_engine, self.tfl(texts))
+        elapsed = time.time() - start
+        # the fast fragments do not wait for the slow one:
+        # in windows of two fragments, this would take 0.6 + 4 * 0.05 s
+        self.assertLess(elapsed, 0.7)
+        self.assertEqual([a[2] for a in anchors], texts)
+
+    def test_loop_fragments_dedup_cache(self):
+        tts_engine = self.wrapper(parallelism=4, cache=True)
+        anchors, total_time, num_chars = self.synthesize(tts_engine, self.tfl([u"aa", u"aa", u"b", u"aa", u"b", u"c"]))
+        self.assertEqual(sorted(tts_engine.calls), [u"aa", u"b", u"c"])
+        self.assertEqual(len(anchors), 6)
+        self.assertEqual(total_time, TimeValue("0.090"))
+
+    def test_loop_fragments_no_dedup_without_cache(self):
+        tts_engine = self.wrapper(parallelism=4)
+        self.synthesize(tts_engine, self.tfl([u"aa", u"aa", u"b", u"aa"]))
+        self.assertEqual(sorted(tts_engine.calls), [u"aa", u"aa", u"aa", u"b"])
+
+    def test_loop_fragments_quit_after(self):
+        texts = [u"a" * 10 for i in range(20)]
+        for parallelism in [1, 4]:
+            tts_engine = self.wrapper(parallelism=parallelism)
+            anchors, total_time, num_chars = self.synthesize(tts_engine, self.tfl(texts), quit_after=TimeValue("0.250"))
+            self.assertEqual(len(anchors), 3)
+            self.assertEqual(total_time, TimeValue("0.300"))
+            # at most one window of fragments is synthesized in vain
+            self.assertLessEqual(len(tts_engine.calls), 4)
+
+    def test_concatenate(self):
+        tts_engine = self.wrapper()
+        result, samples = self.synthesize(tts_engine, self.tfl([u"a", u"bb", u"", u"ccc"]), read_samples=True)
+        self.assertEqual(len(samples), 960)
+        self.assertEqual(self.runs(samples), [(ord(u"a"), 160), (ord(u"b"), 320), (ord(u"c"), 480)])
+
+    def test_concatenate_backwards(self):
+        tts_engine = self.wrapper()
+        result, samples = self.synthesize(tts_engine, self.tfl([u"a", u"bb", u"", u"ccc"]), backwards=True, read_samples=True)
+        self.assertEqual(tts_engine.calls, [u"ccc", u"", u"bb", u"a"])
+        self.assertEqual(len(samples), 960)
+        self.assertEqual(self.runs(samples), [(ord(u"a"), 160), (ord(u"b"), 320), (ord(u"c"), 480)])
+
+    def test_concatenate_backwards_quit_after(self):
+        tts_engine = self.wrapper()
+        result, samples = self.synthesize(tts_engine, self.tfl([u"a", u"bb", u"ccc"]), quit_after=TimeValue("0.020"), backwards=True, read_samples=True)
+        self.assertEqual(tts_engine.calls, [u"ccc"])
+        self.assertEqual(self.runs(samples), [(ord(u"c"), 480)])
+
+    def test_concatenate_parallel(self):
+        texts = [u"a", u"bb", u"ccc", u"dddd", u"e"]
+        result, expected = self.synthesize(self.wrapper(), self.tfl(texts), read_samples=True)
+        result, samples = self.synthesize(self.wrapper(parallelism=4), self.tfl(texts), read_samples=True)
+        self.assertTrue(numpy.array_equal(samples, expected))
+
+
+class TestBaseTTSWrapperSubprocessCall(unittest.TestCase):
+
+    def tfl(self, texts):
+        tfl = TextFile()
+        for i, text in enumerate(texts):
+            tfl.add_fragment(TextFragment(u"f%03d" % i, Language.ENG, [text], [text]))
+        return tfl
+
+    def synthesize(self, cache):
+        rconf = RuntimeConfiguration()
+        rconf[RuntimeConfiguration.TTS_CACHE] = cache
+        tts_engine = DummyStdoutTTSWrapper(rconf=rconf)
+        handler, output_file_path = gf.tmp_file(suffix=".wav")
+        try:
+            result = tts_engine.synthesize_multiple(self.tfl([u"a", u"bb", u"", u"ccc"]), output_file_path)
+            sample_rate, samples = scipywavread(output_file_path)
+        finally:
+            gf.delete_file(handler, output_file_path)
+            tts_engine.clear_cache()
+        return (tts_engine, result, samples)
+
+    def test_wave_stdout_in_memory(self):
+        tts_engine, result, samples = self.synthesize(cache=False)
+        anchors, total_time, num_chars = result
+        self.assertEqual([a[0] for a in anchors], [TimeValue("0.000"), TimeValue("0.010"), TimeValue("0.030"), TimeValue("0.030")])
+        self.assertEqual(total_time, TimeValue("0.060"))
+        self.assertEqual(len(samples), 960)
+        self.assertTrue(numpy.all(samples == 1000))
+        # the audio data never went through a file on disk
+        self.assertEqual(tts_engine.files_read, [])
+
+    def test_wave_stdout_to_file(self):
+        tts_engine, result, samples = self.synthesize(cache=True)
+        anchors, total_time, num_chars = result
+        self.assertEqual(total_time, TimeValue("0.060"))
+        self.assertEqual(len(samples), 960)
+        # the cache needs the audio data on disk
+        self.assertEqual(len(tts_engine.files_read), 3)
+
+    def test_read_audio_data_from_bytes_invalid(self):
+        tts_engine = DummyStdoutTTSWrapper()
+        self.assertEqual(tts_engine._read_audio_data_from_bytes(b"not a WAVE file"), (False, None))
+
+
+class TestTTSRateLimiter(unittest.TestCase):
+
+    def elapsed(self, function, times=1):
+        start = time.time()
+        for i in range(times):
+            function()
+        return time.time() - start
+
+    def test_no_interval(self):
+        limiter = TTSRateLimiter(interval=TimeValue("0.000"))
+        self.assertLess(self.elapsed(limiter.acquire, 100), 0.1)
+
+    def test_capacity_default(self):
+        limiter = TTSRateLimiter(interval=TimeValue("0.200"))
+        self.assertEqual(limiter.capacity, 1)
+        self.assertLess(self.elapsed(limiter.acquire), 0.1)
+        self.assertGreater(self.elapsed(limiter.acquire), 0.1)
+
+    def test_capacity_invalid(self):
+        limiter = TTSRateLimiter(interval=TimeValue("0.200"), capacity=0)
+        self.assertEqual(limiter.capacity, 1)
+
+    def test_burst(self):
+        limiter = TTSRateLimiter(interval=TimeValue("1.000"), capacity=4)
+        self.assertLess(self.elapsed(limiter.acquire, 4), 0.1)
+        # the bucket is empty, and it gains a token every 1.000 / 4 s
+        elapsed = self.elapsed(limiter.acquire)
+        self.assertGreater(elapsed, 0.15)
+        self.assertLess(elapsed, 0.5)
+
+    def test_refill(self):
+        limiter = TTSRateLimiter(interval=TimeValue("0.200"), capacity=4)
+        self.elapsed(limiter.acquire, 4)
+        time.sleep(0.25)
+        self.assertLess(self.elapsed(limiter.acquire, 4), 0.1)
+
+    def test_threads(self):
+        limiter = TTSRateLimiter(interval=TimeValue("0.400"), capacity=4)
+        threads = [threading.Thread(target=limiter.acquire) for i in range(8)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # four calls start at once, then four more within 0.400 s
+        elapsed = time.time() - start
+        self.assertGreater(elapsed, 0.3)
+        self.assertLess(elapsed, 0.8)
+
+    def test_backoff(self):
+        limiter = TTSRateLimiter(interval=TimeValue("0.000"), capacity=4)
+        limiter.backoff()
+        self.assertEqual(limiter.interval, TTSRateLimiter.MIN_BACKOFF_INTERVAL)
+        self.assertLessEqual(limiter.tokens, 0)
+        limiter.backoff()
+        self.assertEqual(limiter.interval, 2 * TTSRateLimiter.MIN_BACKOFF_INTERVAL)
+        for i in range(10):
+            limiter.backoff()
+        self.assertEqual(limiter.interval, TTSRateLimiter.MAX_BACKOFF_INTERVAL)
+
+    def test_success(self):
+        limiter = TTSRateLimiter(interval=TimeValue("0.500"), capacity=4)
+        limiter.success()
+        self.assertEqual(limiter.interval, 0.5)
+        limiter.backoff()
+        limiter.backoff()
+        self.assertEqual(limiter.interval, 2.0)
+        limiter.success()
+        self.assertEqual(limiter.interval, 1.0)
+        limiter.success()
+        limiter.success()
+        self.assertEqual(limiter.interval, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
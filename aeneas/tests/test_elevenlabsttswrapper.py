@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# aeneas is a Python/C library and a set of tools
+# to automagically synchronize audio and text (aka forced alignment)
+#
+# Copyright (C) 2012-2013, Alberto Pettarin (www.albertopettarin.it)
+# Copyright (C) 2013-2015, ReadBeyond Srl   (www.readbeyond.it)
+# Copyright (C) 2015-2017, Alberto Pettarin (www.albertopettarin.it)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import json
+import os
+import threading
+import unittest
+import wave
+
+from aeneas.exacttiming import TimeValue
+from aeneas.language import Language
+from aeneas.runtimeconfiguration import RuntimeConfiguration
+from aeneas.textfile import TextFile
+from aeneas.textfile import TextFragment
+from aeneas.ttswrappers.elevenlabsttswrapper import ElevenLabsTTSWrapper
+import aeneas.globalfunctions as gf
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+
+try:
+    import requests
+    HAS_REQUESTS = True
+except ImportError:
+    HAS_REQUESTS = False
+
+
+def wave_bytes(data, channels=1, sample_rate=16000):
+    """
+    Return the given PCM16 data wrapped in a WAVE (RIFF) file.
+    """
+    buf = io.BytesIO()
+    wave_file = wave.open(buf, "wb")
+    wave_file.setnchannels(channels)
+    wave_file.setsampwidth(2)
+    wave_file.setframerate(sample_rate)
+    wave_file.writeframes(data)
+    wave_file.close()
+    return buf.getvalue()
+
+
+class FakeResponse(object):
+    """
+    A streamed HTTP response with the given status code and body.
+    """
+
+    class Raw(object):
+        retries = None
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+        self.raw = self.Raw()
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    """
+    An HTTP session which synthesizes each character
+    as 10 ms of a constant PCM16 sample,
+    with 5 ms of silence before and after each text,
+    and each break as 0.5 s of silence,
+    and which records the texts it was asked to synthesize.
+
+    If ``wave_format`` is a tuple ``(channels, sample_rate)``,
+    the audio data is returned in a WAVE file with that format,
+    instead of as raw PCM16 data.
+    """
+
+    SEPARATOR = u" <break time=\"0.5s\" /> "
+
+    def __init__(self, status_code=200, breaks=True, wave_format=None):
+        self.status_code = status_code
+        self.breaks = breaks
+        self.wave_format = wave_format
+        self.texts = []
+        self.bodies = []
+
+    def post(self, url, params=None, stream=False, timeout=None, data=None):
+        text = json.loads(data.decode("utf-8"))["text"]
+        self.texts.append(text)
+        silence = b"\x00\x00" * 80
+        pieces = [silence + b"\xe8\x03" * (160 * len(piece)) + silence for piece in text.split(self.SEPARATOR)]
+        separator = b"\x00\x00" * 8000 if self.breaks else b"\xe8\x03" * 8000
+        body = separator.join(pieces)
+        if self.wave_format is not None:
+            body = wave_bytes(body, *self.wave_format)
+        self.bodies.append(body)
+        return FakeResponse(self.status_code, body)
+
+
+class FakeAPIServer(ThreadingMixIn, HTTPServer):
+    """
+    A local HTTP server answering each POST request
+    with the next ``(status_code, headers)`` pair of ``responses``,
+    or with status code 200 and raw PCM16 data when they are exhausted,
+    and counting the POST requests it received.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), FakeAPIHandler)
+        self.responses = []
+        self.posts = 0
+        self.lock = threading.Lock()
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.posts += 1
+            if len(self.server.responses) > 0:
+                status_code, headers = self.server.responses.pop(0)
+            else:
+                status_code, headers = (200, {})
+        body = b"\xe8\x03" * 1600 if status_code == 200 else b"{}"
+        self.send_response(status_code)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalElevenLabsTTSWrapper(ElevenLabsTTSWrapper):
+    """
+    An Eleven Labs TTS API wrapper calling a local server,
+    retrying without waiting between attempts.
+    """
+
+    URL = None
+
+    RETRY_BACKOFF_FACTOR = 0
+
+
+class TestElevenLabsTTSWrapper(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = gf.tmp_directory()
+
+    def tearDown(self):
+        gf.delete_directory(self.cache_dir)
+
+    def wrapper(self, session, cache=True, ttl=0, batch_size=1, stability=0.75):
+        rconf = RuntimeConfiguration()
+        rconf[RuntimeConfiguration.TTS] = u"elevenlabs"
+        rconf[RuntimeConfiguration.TTS_API_SLEEP] = u"0.000"
+        rconf[RuntimeConfiguration.TTS_CACHE] = cache
+        rconf[RuntimeConfiguration.TTS_CACHE_DIR] = self.cache_dir
+        rconf[RuntimeConfiguration.TTS_CACHE_TTL] = ttl
+        rconf[RuntimeConfiguration.ELEVEN_LABS_BATCH_SIZE] = batch_size
+        rconf[RuntimeConfiguration.ELEVEN_LABS_STABILITY] = stability
+        rconf[RuntimeConfiguration.ELEVEN_LABS_VOICE_ID] = u"V"
+        tts_engine = ElevenLabsTTSWrapper(rconf=rconf)
+        tts_engine._session = session
+        return tts_engine
+
+    def cache_files(self):
+        return sorted(f for f in os.listdir(self.cache_dir) if f.endswith(u".wav"))
+
+    def synthesize_single(self, tts_engine, text, output_file_path=None):
+        succeeded, data = tts_engine._synthesize_single_python_helper(text, u"eng", output_file_path=output_file_path)
+        self.assertTrue(succeeded)
+        return data
+
+    def read_bytes(self, path):
+        with io.open(path, "rb") as input_file:
+            return input_file.read()
+
+    def synthesize(self, tts_engine, texts):
+        tfl = TextFile()
+        for i, text in enumerate(texts):
+            tfl.add_fragment(TextFragment(u"f%03d" % i, Language.ENG, [text], [text]))
+        handler, output_file_path = gf.tmp_file(suffix=".wav")
+        try:
+            return tts_engine.synthesize_multiple(tfl, output_file_path)
+        finally:
+            gf.delete_file(handler, output_file_path)
+            tts_engine.clear_cache()
+
+    def test_persistent_cache_miss_and_hit(self):
+        session = FakeSession()
+        data = self.synthesize_single(self.wrapper(session), u"hello")
+        self.assertEqual(session.texts, [u"hello"])
+        self.assertEqual(len(self.cache_files()), 1)
+        # a new wrapper, as in another run, reads the cache file
+        session = FakeSession()
+        cached_data = self.synthesize_single(self.wrapper(session), u"hello")
+        self.assertEqual(session.texts, [])
+        self.assertEqual(cached_data[0], data[0])
+        self.assertEqual(list(cached_data[3]), list(data[3]))
+
+    def test_persistent_cache_key(self):
+        session = FakeSession()
+        self.synthesize_single(self.wrapper(session), u"hello")
+        self.synthesize_single(self.wrapper(session), u"world")
+        self.synthesize_single(self.wrapper(session, stability=0.5), u"hello")
+        self.assertEqual(session.texts, [u"hello", u"world", u"hello"])
+        self.assertEqual(len(self.cache_files()), 3)
+
+    def test_persistent_cache_disabled(self):
+        session = FakeSession()
+        self.synthesize_single(self.wrapper(session, cache=False), u"hello")
+        self.synthesize_single(self.wrapper(session, cache=False), u"hello")
+        self.assertEqual(session.texts, [u"hello", u"hello"])
+        self.assertEqual(self.cache_files(), [])
+
+    def test_persistent_cache_ttl(self):
+        session = FakeSession()
+        self.synthesize_single(self.wrapper(session, ttl=60), u"hello")
+        self.synthesize_single(self.wrapper(session, ttl=60), u"hello")
+        self.assertEqual(session.texts, [u"hello"])
+        # make the cache file older than its ttl
+        sidecar_path = os.path.join(self.cache_dir, self.cache_files()[0] + u".json")
+        with io.open(sidecar_path, "r", encoding="utf-8") as sidecar_file:
+            metadata = json.load(sidecar_file)
+        metadata["created_at"] -= 120
+        with io.open(sidecar_path, "w", encoding="utf-8") as sidecar_file:
+            sidecar_file.write(gf.safe_unicode(json.dumps(metadata)))
+        self.synthesize_single(self.wrapper(session, ttl=60), u"hello")
+        self.assertEqual(session.texts, [u"hello", u"hello"])
+        self.assertEqual(len(self.cache_files()), 1)
+
+    def test_persistent_cache_error_status(self):
+        session = FakeSession(status_code=401)
+        with self.assertRaises(ValueError):
+            self.synthesize_single(self.wrapper(session), u"hello")
+        self.assertEqual(self.cache_files(), [])
+
+    def test_batch_disabled(self):
+        session = FakeSession()
+        anchors, total_time, num_chars = self.synthesize(self.wrapper(session, cache=False), [u"a", u"bb", u"ccc"])
+        self.assertEqual(session.texts, [u"a", u"bb", u"ccc"])
+        self.assertEqual(total_time, TimeValue("0.090"))
+
+    def test_batch_split(self):
+        session = FakeSession()
+        anchors, total_time, num_chars = self.synthesize(self.wrapper(session, cache=False, batch_size=3), [u"a", u"bb", u"ccc"])
+        self.assertEqual(session.texts, [FakeSession.SEPARATOR.join([u"a", u"bb", u"ccc"])])
+        # each text keeps its own silence, plus half of each adjacent break
+        self.assertEqual([a[0] for a in anchors], [TimeValue("0.000"), TimeValue("0.270"), TimeValue("0.800")])
+        self.assertEqual(total_time, TimeValue("1.090"))
+
+    def test_batch_size(self):
+        session = FakeSession()
+        self.synthesize(self.wrapper(session, cache=False, batch_size=2), [u"a", u"bb", u"ccc", u"dddd", u"eeeee"])
+        self.assertEqual(session.texts, [
+            FakeSession.SEPARATOR.join([u"a", u"bb"]),
+            FakeSession.SEPARATOR.join([u"ccc", u"dddd"]),
+            u"eeeee"
+        ])
+
+    def test_batch_max_characters(self):
+        session = FakeSession()
+        tts_engine = self.wrapper(session, cache=False, batch_size=10)
+        # the break between the two texts does not fit
+        tts_engine.BATCH_MAX_CHARACTERS = 2 * 10 + len(FakeSession.SEPARATOR) - 1
+        self.synthesize(tts_engine, [u"a" * 10, u"b" * 10])
+        self.assertEqual(session.texts, [u"a" * 10, u"b" * 10])
+        tts_engine.BATCH_MAX_CHARACTERS = 2 * 10 + len(FakeSession.SEPARATOR)
+        session.texts = []
+        self.synthesize(tts_engine, [u"a" * 10, u"b" * 10])
+        self.assertEqual(session.texts, [FakeSession.SEPARATOR.join([u"a" * 10, u"b" * 10])])
+
+    def test_batch_fallback(self):
+        session = FakeSession(breaks=False)
+        anchors, total_time, num_chars = self.synthesize(self.wrapper(session, cache=False, batch_size=3), [u"a", u"bb", u"ccc"])
+        self.assertEqual(session.texts, [FakeSession.SEPARATOR.join([u"a", u"bb", u"ccc"]), u"a", u"bb", u"ccc"])
+        self.assertEqual(total_time, TimeValue("0.090"))
+
+    def test_batch_not_in_persistent_cache(self):
+        session = FakeSession()
+        self.synthesize(self.wrapper(session, batch_size=3), [u"a", u"bb", u"ccc"])
+        self.assertEqual(len(session.texts), 1)
+        self.assertEqual(self.cache_files(), [])
+        # texts already in the persistent cache are not batched
+        self.synthesize_single(self.wrapper(session), u"bb")
+        session.texts = []
+        anchors, total_time, num_chars = self.synthesize(self.wrapper(session, batch_size=3), [u"a", u"bb", u"ccc"])
+        self.assertEqual(session.texts, [FakeSession.SEPARATOR.join([u"a", u"ccc"])])
+
+    def test_wave_body_decoded(self):
+        raw_data = self.synthesize_single(self.wrapper(FakeSession(), cache=False), u"hello")
+        session = FakeSession(wave_format=(1, 16000))
+        wave_data = self.synthesize_single(self.wrapper(session, cache=False), u"hello")
+        self.assertEqual(session.bodies[0][0:4], b"RIFF")
+        self.assertEqual(wave_data[0], raw_data[0])
+        self.assertEqual(wave_data[1], raw_data[1])
+        self.assertEqual(list(wave_data[3]), list(raw_data[3]))
+
+    def test_wave_body_wrong_sample_rate(self):
+        session = FakeSession(wave_format=(1, 22050))
+        with self.assertRaises(ValueError):
+            self.synthesize_single(self.wrapper(session), u"hello")
+        self.assertEqual(self.cache_files(), [])
+
+    def test_wave_body_wrong_channels(self):
+        session = FakeSession(wave_format=(2, 16000))
+        with self.assertRaises(ValueError):
+            self.synthesize_single(self.wrapper(session), u"hello")
+        self.assertEqual(self.cache_files(), [])
+
+    def test_wave_body_written_as_is(self):
+        session = FakeSession(wave_format=(1, 16000))
+        handler, output_file_path = gf.tmp_file(suffix=".wav")
+        try:
+            self.synthesize_single(self.wrapper(session), u"hello", output_file_path)
+            self.assertEqual(self.read_bytes(output_file_path), session.bodies[0])
+        finally:
+            gf.delete_file(handler, output_file_path)
+        cache_file_path = os.path.join(self.cache_dir, self.cache_files()[0])
+        self.assertEqual(self.read_bytes(cache_file_path), session.bodies[0])
+
+    def test_raw_body_written_with_one_header(self):
+        session = FakeSession()
+        handler, output_file_path = gf.tmp_file(suffix=".wav")
+        try:
+            self.synthesize_single(self.wrapper(session), u"hello", output_file_path)
+            output_bytes = self.read_bytes(output_file_path)
+        finally:
+            gf.delete_file(handler, output_file_path)
+        cache_file_path = os.path.join(self.cache_dir, self.cache_files()[0])
+        self.assertEqual(self.read_bytes(cache_file_path), output_bytes)
+        self.assertEqual(output_bytes, wave_bytes(session.bodies[0]))
+        self.assertEqual(output_bytes.count(b"RIFF"), 1)
+        wave_file = wave.open(io.BytesIO(output_bytes), "rb")
+        self.assertEqual((wave_file.getnchannels(), wave_file.getsampwidth(), wave_file.getframerate()), (1, 2, 16000))
+        self.assertEqual(wave_file.readframes(wave_file.getnframes()), session.bodies[0])
+        wave_file.close()
+
+    def test_wave_body_cache_hit_written_as_is(self):
+        session = FakeSession(wave_format=(1, 16000))
+        self.synthesize_single(self.wrapper(session), u"hello")
+        handler, output_file_path = gf.tmp_file(suffix=".wav")
+        try:
+            self.synthesize_single(self.wrapper(session), u"hello", output_file_path)
+            self.assertEqual(len(session.texts), 1)
+            self.assertEqual(self.read_bytes(output_file_path), session.bodies[0])
+        finally:
+            gf.delete_file(handler, output_file_path)
+
+
+class TestElevenLabsTTSWrapperRetry(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeAPIServer()
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        LocalElevenLabsTTSWrapper.URL = "http://127.0.0.1:%d" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.responses = []
+        self.server.posts = 0
+
+    def wrapper(self, attempts=None):
+        rconf = RuntimeConfiguration()
+        rconf[RuntimeConfiguration.TTS] = u"elevenlabs"
+        rconf[RuntimeConfiguration.TTS_API_SLEEP] = u"0.000"
+        rconf[RuntimeConfiguration.ELEVEN_LABS_API_KEY] = u"K"
+        rconf[RuntimeConfiguration.ELEVEN_LABS_VOICE_ID] = u"V"
+        if attempts is not None:
+            rconf[RuntimeConfiguration.TTS_API_RETRY_ATTEMPTS] = attempts
+        return LocalElevenLabsTTSWrapper(rconf=rconf)
+
+    def synthesize_single(self, tts_engine):
+        return tts_engine._synthesize_single_python_helper(u"hello", u"eng")
+
+    def test_success(self):
+        if not HAS_REQUESTS:
+            return
+        succeeded, data = self.synthesize_single(self.wrapper())
+        self.assertTrue(succeeded)
+        self.assertEqual(data[0], TimeValue("0.100"))
+        self.assertEqual(self.server.posts, 1)
+
+    def test_client_error_fails_fast(self):
+        if not HAS_REQUESTS:
+            return
+        self.server.responses = [(401, {})]
+        with self.assertRaises(ValueError):
+            self.synthesize_single(self.wrapper())
+        self.assertEqual(self.server.posts, 1)
+
+    def test_transient_error_recovers(self):
+        if not HAS_REQUESTS:
+            return
+        self.server.responses = [(503, {})]
+        succeeded, data = self.synthesize_single(self.wrapper())
+        self.assertTrue(succeeded)
+        self.assertEqual(self.server.posts, 2)
+
+    def test_transient_errors_exhaust_attempts(self):
+        if not HAS_REQUESTS:
+            return
+        self.server.responses = [(500, {})] * 10
+        with self.assertRaises(ValueError):
+            self.synthesize_single(self.wrapper())
+        self.assertEqual(self.server.posts, 5)
+
+    def test_attempts_count_first_post(self):
+        if not HAS_REQUESTS:
+            return
+        for attempts in [1, 2, 3]:
+            self.setUp()
+            self.server.responses = [(500, {})] * 10
+            with self.assertRaises(ValueError):
+                self.synthesize_single(self.wrapper(attempts=attempts))
+            self.assertEqual(self.server.posts, attempts)
+
+    def test_attempts_zero(self):
+        if not HAS_REQUESTS:
+            return
+        with self.assertRaises(ValueError):
+            self.synthesize_single(self.wrapper(attempts=0))
+        self.assertEqual(self.server.posts, 0)
+
+    def test_rate_limited_backs_off(self):
+        if not HAS_REQUESTS:
+            return
+        self.server.responses = [(429, {"Retry-After": "0"})]
+        tts_engine = self.wrapper()
+        succeeded, data = self.synthesize_single(tts_engine)
+        self.assertTrue(succeeded)
+        self.assertEqual(self.server.posts, 2)
+        # the interval widened by the 429 is not halved by the recovered request
+        self.assertEqual(tts_engine._rate_limiter.interval, tts_engine._rate_limiter.MIN_BACKOFF_INTERVAL)
+
+
+if __name__ == "__main__":
+    unittest.main()
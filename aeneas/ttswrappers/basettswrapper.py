@@ -26,6 +26,8 @@ This module contains the following classes:
 
 * :class:`~aeneas.ttswrappers.basettswrapper.TTSCache`,
   a TTS cache;
+* :class:`~aeneas.ttswrappers.basettswrapper.TTSRateLimiter`,
+  a rate limiter for TTS API calls;
 * :class:`~aeneas.ttswrappers.basettswrapper.BaseTTSWrapper`,
   an abstract wrapper for a TTS engine.
 """
@@ -34,12 +36,21 @@ from __future__ import absolute_import
 from __future__ import print_function
 import io
 import subprocess
+import threading
+import time
+
+try:
+    from time import monotonic
+except ImportError:
+    # NOTE time.monotonic() is not available in Python 2
+    from time import time as monotonic
 
 from aeneas.audiofile import AudioFile
 from aeneas.audiofile import AudioFileUnsupportedFormatError
 from aeneas.exacttiming import TimeValue
 from aeneas.logger import Loggable
 from aeneas.runtimeconfiguration import RuntimeConfiguration
+from aeneas.wavfile import read as scipywavread
 import aeneas.globalfunctions as gf
 
 
@@ -137,6 +148,97 @@ class TTSCache(Loggable):
         self.log(u"Clearing cache... done")
 
 
+class TTSRateLimiter(Loggable):
+    """
+    A token bucket rate limiter for TTS API calls,
+    which can be shared by several threads.
+
+    The bucket holds up to ``capacity`` tokens,
+    and it is refilled at ``capacity`` tokens every ``interval`` seconds,
+    so that each of ``capacity`` concurrent callers
+    can make one call every ``interval`` seconds.
+    Each call to :func:`acquire` takes a token:
+    while tokens remain it returns immediately,
+    otherwise it sleeps only until its token is available.
+
+    If the API signals that the rate was exceeded,
+    :func:`backoff` empties the bucket and doubles the interval,
+    which is then gradually restored by :func:`success`.
+
+    :param interval: the time needed to refill the whole bucket, in seconds
+    :type  interval: :class:`~aeneas.exacttiming.TimeValue`
+    :param int capacity: the maximum number of tokens in the bucket
+    :param rconf: a runtime configuration
+    :type  rconf: :class:`~aeneas.runtimeconfiguration.RuntimeConfiguration`
+    :param logger: the logger object
+    :type  logger: :class:`~aeneas.logger.Logger`
+    """
+
+    MIN_BACKOFF_INTERVAL = 1.0
+    """ Minimum interval after a backoff, in seconds """
+
+    MAX_BACKOFF_INTERVAL = 60.0
+    """ Maximum interval after a backoff, in seconds """
+
+    TAG = u"TTSRateLimiter"
+
+    def __init__(self, interval, capacity=1, rconf=None, logger=None):
+        super(TTSRateLimiter, self).__init__(rconf=rconf, logger=logger)
+        self.base_interval = float(interval)
+        self.interval = self.base_interval
+        self.capacity = max(1, int(capacity))
+        self.tokens = float(self.capacity)
+        self.last_refill = monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        """
+        Add the tokens gained since the last refill,
+        up to ``capacity``.
+
+        Must be called while holding ``lock``.
+        """
+        if self.interval <= 0:
+            self.tokens = float(self.capacity)
+        else:
+            self.tokens = min(float(self.capacity), self.tokens + (now - self.last_refill) * self.capacity / self.interval)
+        self.last_refill = now
+
+    def acquire(self):
+        """
+        Block until the next call to the API is allowed.
+        """
+        with self.lock:
+            self._refill(monotonic())
+            # NOTE tokens might go negative, meaning that they are
+            #      reserved by the threads already waiting for them
+            self.tokens -= 1
+            delay = -self.tokens * self.interval / self.capacity if self.tokens < 0 else 0
+        if delay > 0:
+            self.log([u"Sleeping %.3f s to throttle API usage", delay])
+            time.sleep(delay)
+
+    def backoff(self):
+        """
+        Empty the bucket and double the interval between calls,
+        for example after receiving HTTP status code 429.
+        """
+        with self.lock:
+            self._refill(monotonic())
+            self.interval = min(max(2 * self.interval, self.MIN_BACKOFF_INTERVAL), self.MAX_BACKOFF_INTERVAL)
+            self.tokens = min(self.tokens, 0.0)
+        self.log_warn([u"Backing off, interval between API calls is now %.3f s", self.interval])
+
+    def success(self):
+        """
+        Halve the interval between calls,
+        until it reaches its original value.
+        """
+        with self.lock:
+            self._refill(monotonic())
+            self.interval = max(self.base_interval, self.interval / 2)
+
+
 class BaseTTSWrapper(Loggable):
     """
     An abstract wrapper for a TTS engine.
@@ -510,7 +612,7 @@ class BaseTTSWrapper(Loggable):
         self.log(u"Synthesizing multiple via subprocess... done")
         return ret
 
-    def _synthesize_single_subprocess_helper(self, text, voice_code, output_file_path=None, return_audio_data=True):
+    def _synthesize_single_subprocess_helper(self, text, voice_code, output_file_path=None, return_audio_data=True, text_file=None):
         """
         This is an helper function to synthesize a single text fragment via ``subprocess``.
 
@@ -532,8 +634,18 @@ class BaseTTSWrapper(Loggable):
             self.log(u"len(text) is zero: returning 0.000")
             return (True, (TimeValue("0.000"), None, None, None))
 
+        # if the TTS engine writes PCM16 mono WAVE data to stdout
+        # and the caller does not need it on disk,
+        # read the audio data directly from memory
+        wave_stdout = (self.CLI_PARAMETER_WAVE_STDOUT in self.subprocess_arguments)
+        in_memory = (
+            (output_file_path is None) and
+            (wave_stdout) and
+            (self.OUTPUT_AUDIO_FORMAT == ("pcm_s16le", 1, self.rconf.sample_rate))
+        )
+
         # create a temporary output file if needed
-        synt_tmp_file = (output_file_path is None)
+        synt_tmp_file = (output_file_path is None) and (not in_memory)
         if synt_tmp_file:
             self.log(u"Synthesizer helper called with output_file_path=None => creating temporary output file")
             output_file_handler, output_file_path = gf.tmp_file(suffix=u".wav", root=self.rconf[RuntimeConfiguration.TMP_PATH])
@@ -580,16 +692,18 @@ class BaseTTSWrapper(Loggable):
             self.log(u"Calling TTS engine...")
             self.log([u"Calling with arguments '%s'", arguments])
             self.log([u"Calling with text '%s'", text])
+            # NOTE audio data written to stdout is binary,
+            #      so in that case stdin and stdout must not be text streams
             proc = subprocess.Popen(
                 arguments,
                 stdout=subprocess.PIPE,
                 stdin=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                universal_newlines=True
+                universal_newlines=(not wave_stdout)
             )
             if self.CLI_PARAMETER_TEXT_STDIN in self.subprocess_arguments:
                 self.log(u"Passing text via stdin...")
-                if gf.PY2:
+                if gf.PY2 or wave_stdout:
                     (stdoutdata, stderrdata) = proc.communicate(input=gf.safe_bytes(text))
                 else:
                     (stdoutdata, stderrdata) = proc.communicate(input=text)
@@ -602,7 +716,9 @@ class BaseTTSWrapper(Loggable):
             proc.stdin.close()
             proc.stderr.close()
 
-            if self.CLI_PARAMETER_WAVE_STDOUT in self.subprocess_arguments:
+            if in_memory:
+                self.log(u"TTS engine wrote audio data to stdout, keeping it in memory")
+            elif wave_stdout:
                 self.log(u"TTS engine wrote audio data to stdout")
                 self.log([u"Writing audio data to file '%s'...", output_file_path])
                 with io.open(output_file_path, "wb") as output_file:
@@ -620,6 +736,10 @@ class BaseTTSWrapper(Loggable):
             self.log_exc(u"An unexpected error occurred while calling TTS engine via subprocess", exc, False, None)
             return (False, None)
 
+        # read audio data from memory, if it was not written to file
+        if in_memory:
+            return self._read_audio_data_from_bytes(stdoutdata) if return_audio_data else (True, None)
+
         # check the file can be read
         if not gf.file_can_be_read(output_file_path):
             self.log_exc(u"Output file '%s' cannot be read" % (output_file_path), None, True, None)
@@ -667,6 +787,34 @@ class BaseTTSWrapper(Loggable):
             self.log_exc(u"An unexpected error occurred while reading audio data", exc, True, None)
             return (False, None)
 
+    def _read_audio_data_from_bytes(self, data):
+        """
+        Read audio data from the given PCM16 mono WAVE bytes,
+        without writing them to disk.
+
+        :rtype: tuple (True, (duration, sample_rate, codec, data)) or (False, None) on exception
+        """
+        try:
+            self.log(u"Reading audio data from memory...")
+            audio_sample_rate, audio_samples = scipywavread(io.BytesIO(data))
+            # scipy reads a sample as an int16_t, that is, a number in [-32768, 32767]
+            # so we convert it to a float64 in [-1, 1]
+            audio_samples = audio_samples.astype("float64") / 32768
+            audio_length = TimeValue(len(audio_samples)) / TimeValue(audio_sample_rate)
+            self.log([u"Duration: %f", audio_length])
+            self.log(u"Reading audio data from memory... done")
+            return (True, (
+                audio_length,
+                audio_sample_rate,
+                "pcm16",
+                audio_samples
+            ))
+        except ValueError as exc:
+            # NOTE scipywavread raises ValueError on malformed or unsupported WAVE data,
+            #      which AudioFile reports as AudioFileUnsupportedFormatError
+            self.log_exc(u"An unexpected error occurred while reading audio data from memory", exc, True, None)
+            return (False, None)
+
     def _synthesize_multiple_generic(self, helper_function, text_file, output_file_path, quit_after=None, backwards=False):
         """
         Synthesize multiple fragments, generic function.
@@ -709,19 +857,14 @@ class BaseTTSWrapper(Loggable):
 
         # create output
         anchors = []
+        samples_list = []
         current_time = TimeValue("0.000")
         num_chars = 0
         fragments = text_file.fragments
         if backwards:
             fragments = fragments[::-1]
         loop_function = self._loop_use_cache if self.use_cache else self._loop_no_cache
-        for num, fragment in enumerate(fragments):
-            succeeded, data = loop_function(
-                helper_function=helper_function,
-                num=num,
-                fragment=fragment,
-                text_file=text_file
-            )
+        for num, fragment, succeeded, data in self._loop_fragments(loop_function, helper_function, fragments, text_file, quit_after):
             if not succeeded:
                 self.log_crit(u"An unexpected error occurred in loop_function")
                 return (False, None)
@@ -730,12 +873,12 @@ class BaseTTSWrapper(Loggable):
             anchors.append([current_time, fragment.identifier, fragment.text])
             # increase the character counter
             num_chars += fragment.characters
-            # concatenate new samples
+            # store new samples, to be concatenated at the end
             self.log([u"Fragment %d starts at: %.3f", num, current_time])
             if duration > 0:
                 self.log([u"Fragment %d duration: %.3f", num, duration])
                 current_time += duration
-                output_file.add_samples(samples, reverse=backwards)
+                samples_list.append(samples)
             else:
                 self.log([u"Fragment %d has zero duration", num])
             # check if we must stop synthesizing because we have enough audio
@@ -743,10 +886,16 @@ class BaseTTSWrapper(Loggable):
                 self.log([u"Quitting after reached duration %.3f", current_time])
                 break
 
-        # minimize memory
-        self.log(u"Minimizing memory...")
-        output_file.minimize_memory()
-        self.log(u"Minimizing memory... done")
+        # concatenate all the samples,
+        # allocating memory for them only once
+        self.log(u"Concatenating audio samples...")
+        samples_length = sum([len(samples) for samples in samples_list])
+        if samples_length > 0:
+            output_file.preallocate_memory(samples_length)
+        for samples in samples_list:
+            output_file.add_samples(samples, reverse=backwards)
+        samples_list = None
+        self.log(u"Concatenating audio samples... done")
 
         # if backwards, we need to reverse the audio samples again
         if backwards:
@@ -767,6 +916,71 @@ class BaseTTSWrapper(Loggable):
         self.log(u"Calling TTS engine using multiple generic function... done")
         return (True, (anchors, current_time, num_chars))
 
+    def _loop_fragments(self, loop_function, helper_function, fragments, text_file, quit_after=None):
+        """
+        Synthesize the given fragments with ``loop_function``,
+        yielding tuples ``(num, fragment, succeeded, data)``
+        in the order of the fragments.
+
+        If ``RuntimeConfiguration.TTS_API_PARALLELISM`` is greater than one,
+        the fragments are synthesized concurrently.
+        If ``quit_after`` is ``None``, all the fragments are queued at once,
+        so that a worker never waits for a slower request to complete;
+        otherwise they are queued in windows of ``TTS_API_PARALLELISM`` fragments,
+        so that if the caller stops consuming early
+        at most one window of fragments is synthesized in vain.
+        """
+        parallelism = self.rconf[RuntimeConfiguration.TTS_API_PARALLELISM]
+        if parallelism > 1:
+            # NOTE concurrent.futures is not available in Python 2
+            #      unless the futures backport is installed
+            try:
+                from concurrent.futures import ThreadPoolExecutor
+            except ImportError as exc:
+                self.log_exc(u"Unable to import concurrent.futures, synthesizing fragments one at a time", exc, False, None)
+                parallelism = 1
+        if parallelism <= 1:
+            for num, fragment in enumerate(fragments):
+                succeeded, data = loop_function(
+                    helper_function=helper_function,
+                    num=num,
+                    fragment=fragment,
+                    text_file=text_file
+                )
+                yield (num, fragment, succeeded, data)
+            return
+
+        self.log([u"Synthesizing up to %d fragments concurrently", parallelism])
+        window_size = len(fragments) if quit_after is None else parallelism
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            futures = {}
+            try:
+                for start in range(0, len(fragments), window_size):
+                    window = []
+                    for num in range(start, min(start + window_size, len(fragments))):
+                        fragment = fragments[num]
+                        # NOTE when using the cache, identical fragments
+                        #      must be synthesized only once,
+                        #      otherwise they would be added to the cache twice
+                        key = (fragment.language, fragment.filtered_text) if self.use_cache else num
+                        if key not in futures:
+                            futures[key] = executor.submit(
+                                loop_function,
+                                helper_function=helper_function,
+                                num=num,
+                                fragment=fragment,
+                                text_file=text_file
+                            )
+                        window.append((num, fragment, futures[key]))
+                    for num, fragment, future in window:
+                        succeeded, data = future.result()
+                        yield (num, fragment, succeeded, data)
+            finally:
+                # NOTE if the caller stopped consuming early,
+                #      do not synthesize the fragments still queued
+                for future in futures.values():
+                    future.cancel()
+
     def _loop_no_cache(self, helper_function, num, fragment, text_file):
         """ Synthesize all fragments without using the cache """
         self.log([u"Examining fragment %d (no cache)...", num])
@@ -51,15 +51,22 @@ for further details.
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
+import hashlib
+import io
+import json
 import numpy
+import os
+import shutil
+import threading
 import time
-import uuid
+import wave
 
 from aeneas.audiofile import AudioFile
 from aeneas.exacttiming import TimeValue
 from aeneas.language import Language
 from aeneas.runtimeconfiguration import RuntimeConfiguration
 from aeneas.ttswrappers.basettswrapper import BaseTTSWrapper
+from aeneas.ttswrappers.basettswrapper import TTSRateLimiter
 import aeneas.globalfunctions as gf
 
 
@@ -263,96 +270,503 @@ class ElevenLabsTTSWrapper(BaseTTSWrapper):
 
     END_POINT = "/v1/text-to-speech/"
 
+    STREAM_SUFFIX = "/stream"
+    """ Use the streaming endpoint, which sends audio chunks as soon as they are synthesized """
+
+    STREAM_CHUNK_SIZE = 65536
+    """ Read the audio stream in chunks of this many bytes """
+
+    TIMEOUT = (3.05, 30)
+    """ Connect and read timeouts for API requests, in seconds """
+
+    RETRY_STATUS_CODES = [408, 425, 429, 500, 502, 503, 504]
+    """ Retry a request only if the API returns one of these (transient) status codes """
+
+    RETRY_BACKOFF_FACTOR = 0.5
+    """ Exponential backoff factor between retries, in seconds """
+
+    BATCH_BREAK = 0.5
+    """ Length of the break separating the texts of a batch, in seconds """
+
+    BATCH_BREAK_MIN_RATIO = 0.8
+    """ A run of silence is a break if it lasts at least this fraction of ``BATCH_BREAK`` """
+
+    BATCH_MAX_CHARACTERS = 1000
+    """ Maximum number of characters of the text of a batch, including the breaks """
+
+    BATCH_SILENCE_THRESHOLD = 64
+    """ PCM16 samples with absolute value below this threshold are silent """
+
+    OUTPUT_FORMAT = "pcm_16000"
+    """ Ask the API for raw 16kHz PCM16 mono, without any container """
+
     def __init__(self, rconf=None, logger=None):
         super(ElevenLabsTTSWrapper, self).__init__(rconf=rconf, logger=logger)
+        self.cache_dir = None
+        if self.use_cache and (self.rconf[RuntimeConfiguration.TTS_CACHE_DIR] is not None):
+            self.cache_dir = self.rconf[RuntimeConfiguration.TTS_CACHE_DIR]
+            gf.ensure_parent_directory(self.cache_dir, ensure_parent=False)
+        self.log([u"Persistent cache dir is  %s", self.cache_dir])
+        # NOTE the JSON request body differs only by its text,
+        #      so the voice settings are serialized only once
+        self._body_prefix = b'{"text":'
+        self._body_suffix = (u',"voice_settings":{"stability":%s,"similarity_boost":%s}}' % (
+            json.dumps(self.rconf[RuntimeConfiguration.ELEVEN_LABS_STABILITY]),
+            json.dumps(self.rconf[RuntimeConfiguration.ELEVEN_LABS_SIMILARITY_BOOST])
+        )).encode("utf-8")
+        # NOTE orjson is optional, and faster than json at serializing request bodies,
+        #      it is imported here so that it is loaded only if this wrapper is used
+        try:
+            import orjson
+            self._orjson_dumps = orjson.dumps
+        except ImportError:
+            self._orjson_dumps = None
+        self._batch_separator = u" <break time=\"%.1fs\" /> " % self.BATCH_BREAK
+        self._prefetched = {}
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._rate_limiter = TTSRateLimiter(
+            interval=self.rconf[RuntimeConfiguration.TTS_API_SLEEP],
+            capacity=self.rconf[RuntimeConfiguration.TTS_API_PARALLELISM],
+            rconf=rconf,
+            logger=logger
+        )
 
-    def _synthesize_single_python_helper(self, text, voice_code, output_file_path=None, return_audio_data=True, text_file=None):
-        self.log(u"Importing requests...")
-        import requests
-        self.log(u"Importing requests... done")
+    def _http_session(self):
+        """
+        Return the HTTP session used to call the API,
+        creating it on first use.
+
+        The session keeps the connections to the API server alive,
+        so that only the first request pays the TCP and TLS handshakes,
+        and it is shared by the threads synthesizing fragments concurrently.
+
+        :rtype: :class:`requests.Session`
+        """
+        with self._session_lock:
+            if self._session is None:
+                self.log(u"Importing requests...")
+                try:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    from urllib3.util.retry import Retry
+                except ImportError as exc:
+                    self.log_exc(u"Unable to import requests for Eleven Labs TTS API wrapper", exc, True, ImportError)
+                self.log(u"Importing requests... done")
+                # NOTE tts_api_retry_attempts counts all the POST requests,
+                #      including the first one, while Retry counts only the retries
+                retry = Retry(
+                    total=max(0, self.rconf[RuntimeConfiguration.TTS_API_RETRY_ATTEMPTS] - 1),
+                    backoff_factor=self.RETRY_BACKOFF_FACTOR,
+                    status_forcelist=self.RETRY_STATUS_CODES,
+                    allowed_methods=frozenset(["POST"]),
+                    respect_retry_after_header=True,
+                    raise_on_status=False
+                )
+                self._session = requests.Session()
+                # NOTE keep one connection per concurrent fragment,
+                #      so that no worker thread has to open a new one
+                pool_maxsize = max(1, self.rconf[RuntimeConfiguration.TTS_API_PARALLELISM])
+                self._session.mount(self.URL, HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry))
+                self._session.headers.update({
+                    u"Content-Type": u"application/json",
+                    u"xi-api-key": self.rconf[RuntimeConfiguration.ELEVEN_LABS_API_KEY]
+                })
+        return self._session
+
+    def _request_body(self, text):
+        """
+        Return the JSON request body for the given text.
+
+        :param string text: the text to be synthesized
+        :rtype: bytes
+        """
+        if self._orjson_dumps is not None:
+            return self._body_prefix + self._orjson_dumps(text) + self._body_suffix
+        return self._body_prefix + json.dumps(text).encode("utf-8") + self._body_suffix
+
+    def _cache_file_path(self, text, voice_id):
+        """
+        Return the path of the persistent cache file
+        for the given text and voice,
+        or ``None`` if the persistent cache is disabled.
+
+        :rtype: string
+        """
+        if self.cache_dir is None:
+            return None
+        key = u"\x00".join([
+            text,
+            u"%s" % voice_id,
+            u"%s" % self.rconf[RuntimeConfiguration.ELEVEN_LABS_STABILITY],
+            u"%s" % self.rconf[RuntimeConfiguration.ELEVEN_LABS_SIMILARITY_BOOST],
+        ])
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, u"%s.wav" % digest)
+
+    def _cache_is_valid(self, cache_file_path):
+        """
+        Return ``True`` if the given persistent cache file exists
+        and it has not expired yet.
+
+        :rtype: bool
+        """
+        if not os.path.isfile(cache_file_path):
+            return False
+        try:
+            with io.open(cache_file_path + u".json", "r", encoding="utf-8") as sidecar_file:
+                metadata = json.load(sidecar_file)
+        except (IOError, OSError, ValueError):
+            self.log_warn(u"Cannot read the metadata of the persistent cache file, ignoring it")
+            return False
+        ttl = metadata.get("ttl", 0)
+        if (ttl > 0) and (time.time() - metadata.get("created_at", 0) > ttl):
+            self.log(u"Persistent cache file expired")
+            return False
+        return True
+
+    def _cache_store(self, cache_file_path, content):
+        """
+        Atomically store the given raw PCM16 or WAVE data
+        into the given persistent cache file,
+        together with its metadata.
+        """
+        tmp_path = None
+        try:
+            tmp_handler, tmp_path = gf.tmp_file(suffix=u".wav", root=self.cache_dir)
+            gf.close_file_handler(tmp_handler)
+            self._write_audio(tmp_path, content)
+            self._replace_file(tmp_path, cache_file_path)
+            tmp_handler, tmp_path = gf.tmp_file(suffix=u".json", root=self.cache_dir)
+            gf.close_file_handler(tmp_handler)
+            with io.open(tmp_path, "w", encoding="utf-8") as sidecar_file:
+                sidecar_file.write(gf.safe_unicode(json.dumps({
+                    "created_at": time.time(),
+                    "ttl": self.rconf[RuntimeConfiguration.TTS_CACHE_TTL],
+                })))
+            self._replace_file(tmp_path, cache_file_path + u".json")
+        except (IOError, OSError) as exc:
+            gf.delete_file(None, tmp_path)
+            self.log_exc(u"Cannot write the persistent cache file", exc, False, None)
+
+    def _replace_file(self, source_path, destination_path):
+        """
+        Atomically move ``source_path`` to ``destination_path``,
+        replacing the latter if it already exists.
+        """
+        if gf.PY2:
+            # NOTE os.replace() is not available in Python 2,
+            #      and on Windows os.rename() fails if the destination exists
+            if gf.is_windows() and os.path.exists(destination_path):
+                os.remove(destination_path)
+            os.rename(source_path, destination_path)
+        else:
+            os.replace(source_path, destination_path)
+
+    def _write_audio(self, file_path, content):
+        """
+        Write the given raw PCM16 or WAVE data to a WAVE file.
+
+        If ``content`` is already a WAVE file, it is written as it is,
+        otherwise a WAVE header is added to the raw PCM16 data.
+        """
+        if content[0:4] == b"RIFF":
+            with io.open(file_path, "wb") as output_file:
+                output_file.write(content)
+            return
+        self._write_wave(file_path, content)
+
+    def _write_wave(self, file_path, data):
+        """
+        Write the given PCM16 data to a WAVE file.
+        """
+        output_file = wave.open(file_path, "wb")
+        output_file.setframerate(self.SAMPLE_RATE)  # sample rate
+        output_file.setnchannels(1)                 # 1 channel, i.e. mono
+        output_file.setsampwidth(2)                 # 16 bit/sample, i.e. 2 bytes/sample
+        output_file.writeframes(data)
+        output_file.close()
+
+    def _synthesize_multiple_python(self, text_file, output_file_path, quit_after=None, backwards=False):
+        batch_size = self.rconf[RuntimeConfiguration.ELEVEN_LABS_BATCH_SIZE]
+        if (batch_size > 1) and (quit_after is None):
+            self._prefetch_batches(text_file, batch_size)
+        try:
+            return super(ElevenLabsTTSWrapper, self)._synthesize_multiple_python(
+                text_file,
+                output_file_path,
+                quit_after,
+                backwards
+            )
+        finally:
+            self._prefetched = {}
+
+    def _prefetch_batches(self, text_file, batch_size):
+        """
+        Synthesize the short fragments of the given text file
+        in batches of up to ``batch_size`` fragments per API call,
+        storing the audio data of each fragment in ``self._prefetched``.
+
+        Fragments which are empty, already in the persistent cache,
+        or whose batch cannot be split reliably,
+        are left to be synthesized one at a time.
+        """
+        self.log([u"Synthesizing fragments in batches of %d...", batch_size])
         voice_id = self.rconf[RuntimeConfiguration.ELEVEN_LABS_VOICE_ID]
-        # prepare request header and contents
-        request_id = str(uuid.uuid4()).replace("-", "")[0:16]
-        headers = {
-            u"xi-api-key": self.rconf[RuntimeConfiguration.ELEVEN_LABS_API_KEY]
-        }
-
-        # sentence = ''
-        # with open(text_file.file_path, 'r') as file:
-        #     # Read all lines from the file
-        #     lines = file.readlines()
-        #     # Strip newline characters and join the lines into a single sentence
-        #     sentence = ' '.join(line.strip() for line in lines)
-
-        # print("SENTENCE")
-        # print(sentence)
-
-        url = "%s%s%s" % (
-            self.URL,
-            self.END_POINT,
-            voice_id
+        batches = []
+        batch = []
+        batch_characters = 0
+        seen = set()
+        for fragment in text_file.fragments:
+            text = fragment.filtered_text
+            if (len(text) == 0) or (len(text) > self.BATCH_MAX_CHARACTERS) or (text in seen):
+                continue
+            seen.add(text)
+            cache_file_path = self._cache_file_path(text, voice_id)
+            if (cache_file_path is not None) and self._cache_is_valid(cache_file_path):
+                continue
+            # NOTE the breaks separating the texts count towards the limit too
+            characters = len(text) + (len(self._batch_separator) if len(batch) > 0 else 0)
+            if (len(batch) >= batch_size) or (batch_characters + characters > self.BATCH_MAX_CHARACTERS):
+                batches.append(batch)
+                batch = []
+                batch_characters = 0
+                characters = len(text)
+            batch.append(text)
+            batch_characters += characters
+        if len(batch) > 0:
+            batches.append(batch)
+        batches = [batch for batch in batches if len(batch) > 1]
+
+        parallelism = self.rconf[RuntimeConfiguration.TTS_API_PARALLELISM]
+        if parallelism > 1:
+            # NOTE concurrent.futures is not available in Python 2
+            #      unless the futures backport is installed
+            try:
+                from concurrent.futures import ThreadPoolExecutor
+            except ImportError as exc:
+                self.log_exc(u"Unable to import concurrent.futures, synthesizing batches one at a time", exc, False, None)
+                parallelism = 1
+        if parallelism > 1:
+            with ThreadPoolExecutor(max_workers=parallelism) as executor:
+                results = list(executor.map(self._synthesize_batch, batches))
+        else:
+            results = [self._synthesize_batch(batch) for batch in batches]
+        for batch, pieces in zip(batches, results):
+            if pieces is not None:
+                self._prefetched.update(zip(batch, pieces))
+        self.log([u"Synthesizing fragments in batches of %d... done", batch_size])
+
+    def _synthesize_batch(self, texts):
+        """
+        Synthesize the given texts with a single API call,
+        separated by breaks of ``BATCH_BREAK`` seconds,
+        and split the resulting audio data at the middle of those breaks.
+
+        Return the list of the PCM16 data of each text,
+        or ``None`` if the breaks cannot be detected unambiguously
+        or if the API call fails.
+
+        :param list texts: the texts to be synthesized
+        :rtype: list of bytes
+        """
+        try:
+            data = self._pcm_from_response(self._request_audio(self._batch_separator.join(texts), self.rconf[RuntimeConfiguration.ELEVEN_LABS_VOICE_ID]))
+        except ValueError as exc:
+            self.log_exc(u"Unable to synthesize batch, falling back to single fragments", exc, False, None)
+            return None
+
+        # find the runs of silence, ignoring leading and trailing silence
+        samples = numpy.frombuffer(data, dtype=numpy.int16, count=len(data) // 2)
+        silent = numpy.concatenate(([False], numpy.abs(samples) < self.BATCH_SILENCE_THRESHOLD, [False]))
+        edges = numpy.diff(silent.astype(numpy.int8))
+        starts = numpy.where(edges == 1)[0]
+        ends = numpy.where(edges == -1)[0]
+        is_break = (
+            (ends - starts >= int(self.BATCH_BREAK * self.BATCH_BREAK_MIN_RATIO * self.SAMPLE_RATE)) &
+            (starts > 0) &
+            (ends < len(samples))
         )
+        starts = starts[is_break]
+        ends = ends[is_break]
+        if len(starts) != len(texts) - 1:
+            self.log_warn([u"Found %d breaks instead of %d, falling back to single fragments", len(starts), len(texts) - 1])
+            return None
 
-        # post request
-        sleep_delay = self.rconf[RuntimeConfiguration.TTS_API_SLEEP]
-        attempts = self.rconf[RuntimeConfiguration.TTS_API_RETRY_ATTEMPTS]
-        self.log([u"Sleep delay:    %.3f", sleep_delay])
-        self.log([u"Retry attempts: %d", attempts])
-        while attempts > 0:
-            self.log(u"Sleeping to throttle API usage...")
-            time.sleep(sleep_delay)
-            self.log(u"Sleeping to throttle API usage... done")
-            self.log(u"Posting...")
-            try:
-                response = requests.post(url, 
-                    headers=headers,
-                    json={
-                        'text': text,
-                        "voice_settings": {
-                            "stability": str(self.rconf[RuntimeConfiguration.ELEVEN_LABS_STABILITY]),
-                            "similarity_boost": str(self.rconf[RuntimeConfiguration.ELEVEN_LABS_SIMILARITY_BOOST]),
-                        }
-                    }
-                )
-            except Exception as exc:
-                self.log_exc(u"Unexpected exception on HTTP POST. Are you offline?", exc, True, ValueError)
-            self.log(u"Posting... done")
-            status_code = response.status_code
-            self.log([u"Status code: %d", status_code])
-            if status_code == 200:
-                self.log(u"Got status code 200, break")
-                break
-            else:
-                self.log_warn(u"Got status code other than 200, retry")
-                attempts -= 1
-
-        if attempts <= 0:
-            self.log_exc(u"All API requests returned status code != 200", None, True, ValueError)
+        # split at the middle of each break, two bytes per sample,
+        # so that each text keeps some leading and trailing silence
+        bounds = [0] + [int(v) for v in (starts + ends) // 2] + [len(samples)]
+        return [data[2 * bounds[k]:2 * bounds[k + 1]] for k in range(len(bounds) - 1)]
+
+    def _synthesize_single_python_helper(self, text, voice_code, output_file_path=None, return_audio_data=True, text_file=None):
+        voice_id = self.rconf[RuntimeConfiguration.ELEVEN_LABS_VOICE_ID]
+
+        # check the persistent cache first
+        cache_file_path = self._cache_file_path(text, voice_id)
+        if (cache_file_path is not None) and self._cache_is_valid(cache_file_path):
+            self.log([u"Reading persistent cache file '%s'", cache_file_path])
+            with io.open(cache_file_path, "rb") as cache_file:
+                data = self._pcm_from_response(cache_file.read())
+            if output_file_path is not None:
+                shutil.copyfile(cache_file_path, output_file_path)
+            return (True, self._pcm_to_audio_data(data))
+
+        # use the audio data of a batch, if available,
+        # otherwise call the API
+        batched = text in self._prefetched
+        if batched:
+            self.log(u"Using audio data synthesized in a batch")
+            content = self._prefetched[text]
+        else:
+            content = self._request_audio(text, voice_id)
+
+        # extract the PCM16 data
+        data = self._pcm_from_response(content)
 
         # save to file if requested
         if output_file_path is None:
             self.log(u"output_file_path is None => not saving to file")
         else:
             self.log(u"output_file_path is not None => saving to file...")
-            import wave
-            output_file = wave.open(output_file_path, "wb")
-            output_file.setframerate(self.SAMPLE_RATE)  # sample rate
-            output_file.setnchannels(1)                 # 1 channel, i.e. mono
-            output_file.setsampwidth(2)                 # 16 bit/sample, i.e. 2 bytes/sample
-            output_file.writeframes(response.content)
-            output_file.close()
+            self._write_audio(output_file_path, content)
             self.log(u"output_file_path is not None => saving to file... done")
 
-        # get length and data
+        # save to the persistent cache if enabled
+        # NOTE the silence around a text synthesized in a batch differs
+        #      from the one synthesized alone, hence it is not cached,
+        #      since the cache key does not distinguish the two cases
+        if (cache_file_path is not None) and (not batched):
+            self.log([u"Saving to persistent cache file '%s'", cache_file_path])
+            self._cache_store(cache_file_path, content)
+
+        # return data
+        return (True, self._pcm_to_audio_data(data))
+
+    def _request_audio(self, text, voice_id):
+        """
+        Call the API to synthesize the given text
+        with the given voice, and return the response body,
+        that is, raw PCM16 data, or a WAVE file
+        if the API did not honour ``OUTPUT_FORMAT``.
+
+        :param string text: the text to be synthesized
+        :param string voice_id: the Eleven Labs voice ID
+        :rtype: bytearray
+        :raises: ValueError: if the API cannot be reached
+                             or it returns a status code other than 200
+        """
+        # prepare request header and contents
+        if self.rconf[RuntimeConfiguration.TTS_API_RETRY_ATTEMPTS] <= 0:
+            self.log_exc(u"No API request attempted, since tts_api_retry_attempts is not greater than zero", None, True, ValueError)
+        session = self._http_session()
+
+        url = self.URL + self.END_POINT + voice_id + self.STREAM_SUFFIX
+
+        # post request, retrying only on transient errors
+        self._rate_limiter.acquire()
+        self.log(u"Posting...")
+        try:
+            response = session.post(
+                url,
+                params={"output_format": self.OUTPUT_FORMAT},
+                stream=True,
+                timeout=self.TIMEOUT,
+                data=self._request_body(text)
+            )
+        except Exception as exc:
+            self.log_exc(u"Unexpected exception on HTTP POST. Are you offline?", exc, True, ValueError)
+        self.log(u"Posting... done")
+        rate_limited = False
+        retries = getattr(response.raw, "retries", None)
+        if (retries is not None) and (len(retries.history) > 0):
+            self.log_warn([u"Request retried %d times", len(retries.history)])
+            rate_limited = any(attempt.status == 429 for attempt in retries.history)
+        if rate_limited:
+            self._rate_limiter.backoff()
+        status_code = response.status_code
+        self.log([u"Status code: %d", status_code])
+        if status_code != 200:
+            response.close()
+            self.log_exc(u"API request returned status code %d" % status_code, None, True, ValueError)
+        if not rate_limited:
+            # NOTE do not undo the backoff of a request which recovered from a 429
+            self._rate_limiter.success()
+
+        return self._read_stream(response)
+
+    def _read_stream(self, response):
+        """
+        Read the audio chunks of the given streamed response
+        as soon as the API sends them, and return them joined.
+
+        :param response: the response of a request with ``stream=True``
+        :type  response: :class:`requests.Response`
+        :rtype: bytearray
+        """
+        self.log(u"Reading audio stream...")
+        content = bytearray()
+        try:
+            # NOTE the streaming endpoint uses chunked transfer encoding,
+            #      so the length of the body is not known in advance
+            for chunk in response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE):
+                content.extend(chunk)
+        except Exception as exc:
+            self.log_exc(u"Unexpected exception while reading the audio stream", exc, True, ValueError)
+        finally:
+            response.close()
+        self.log(u"Reading audio stream... done")
+        return content
+
+    def _pcm_from_response(self, content):
+        """
+        Return the PCM16 data contained in the given bytes.
+
+        If ``content`` is a WAVE (RIFF) file,
+        for example because the API did not honour ``OUTPUT_FORMAT``
+        or because it was read from the persistent cache,
+        it is parsed in-process and its data chunk is returned;
+        otherwise ``content`` is assumed to be raw PCM16 already.
+
+        :param bytes content: the raw PCM16 or WAVE data
+        :rtype: bytes
+        :raises: ValueError: if ``content`` is a WAVE file not in PCM16 mono format
+                             with the expected sample rate
+        """
+        if content[0:4] != b"RIFF":
+            return content
+        self.log(u"Parsing WAVE data...")
+        try:
+            wave_file = wave.open(io.BytesIO(content), "rb")
+            audio_format = (wave_file.getsampwidth(), wave_file.getnchannels(), wave_file.getframerate())
+            data = wave_file.readframes(wave_file.getnframes())
+            wave_file.close()
+        except (EOFError, wave.Error) as exc:
+            self.log_exc(u"Unable to parse WAVE data", exc, True, ValueError)
+        if audio_format != (2, 1, self.SAMPLE_RATE):
+            self.log_exc(u"WAVE data is not PCM16 mono at %d Hz" % self.SAMPLE_RATE, None, True, ValueError)
+        self.log(u"Parsing WAVE data... done")
+        return data
+
+    def _pcm_to_audio_data(self, data):
+        """
+        Convert the given PCM16 data into the tuple
+        returned by the synthesizer helper.
+
+        :param bytes data: the raw PCM16 data
+        :rtype: tuple (duration, sample_rate, codec, data)
+        """
         audio_sample_rate = self.SAMPLE_RATE
-        trimmed_length = (len(response.content) // 2) * 2
-        number_of_frames = len(response.content) / 2
-        audio_length = TimeValue(number_of_frames / audio_sample_rate)
-        self.log([u"Response (bytes): %d", len(response.content)])
+        number_of_frames = len(data) // 2
+        # NOTE computing TimeValue (... / ...) yields wrong results,
+        #      see issue #168
+        audio_length = TimeValue(number_of_frames) / TimeValue(audio_sample_rate)
+        self.log([u"PCM data (bytes): %d", len(data)])
         self.log([u"Number of frames: %d", number_of_frames])
         self.log([u"Audio length (s): %.3f", audio_length])
         audio_format = "pcm16"
-        audio_samples = numpy.fromstring(response.content[:trimmed_length], dtype=numpy.int16).astype("float64") / 32768
-
-        # return data
-        return (True, (audio_length, audio_sample_rate, audio_format, audio_samples))
+        # NOTE convert and scale the samples in a single pass,
+        #      without allocating an intermediate array
+        pcm_samples = numpy.frombuffer(data, dtype=numpy.int16, count=number_of_frames)
+        audio_samples = numpy.empty(number_of_frames, dtype=numpy.float32)
+        numpy.multiply(pcm_samples, numpy.float32(1.0 / 32768), out=audio_samples)
+        return (audio_length, audio_sample_rate, audio_format, audio_samples)